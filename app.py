@@ -1,4 +1,4 @@
-from flask import Flask, render_template, jsonify, request, session, Blueprint, make_response
+from flask import Flask, render_template, jsonify, request, session, Blueprint, make_response, g, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from datetime import datetime, timedelta
@@ -8,8 +8,11 @@ from dotenv import load_dotenv
 from functools import wraps
 from hashlib import sha256
 import logging
-from flask_wtf.csrf import CSRFProtect, CSRFError
+from flask_wtf.csrf import CSRFProtect, CSRFError, generate_csrf
 import secrets  # Lägg till denna import överst
+import click
+from session_store import init_session_store
+from profiling import init_profiling
 
 # Ladda miljövariabler från .env
 load_dotenv()
@@ -27,8 +30,20 @@ app.secret_key = os.getenv('SECRET_KEY')
 app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'  # True i produktion
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # Skydda mot XSS
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # Balanserad säkerhet för kalender-app
-app.config['SESSION_TYPE'] = 'filesystem'
+app.config['SESSION_TYPE'] = os.getenv('SESSION_TYPE', 'sqlalchemy')  # 'sqlalchemy' (databasen) eller 'sqlite' (lokal fil)
+app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH')  # Default: instance/sessions.sqlite3
+app.config['SESSION_CACHE_SIZE'] = int(os.getenv('SESSION_CACHE_SIZE', '256'))  # Antal sessioner i cachen per worker
+app.config['SESSION_CACHE_TTL'] = int(os.getenv('SESSION_CACHE_TTL', '5'))  # Sekunder innan en cachad session läses om
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+app.config['SESSION_TRANSIENT_LIFETIME'] = timedelta(minutes=int(os.getenv('SESSION_TRANSIENT_LIFETIME_MINUTES', '60')))  # Icke-permanenta sessioner på servern
+
+# Profilering av enskilda requests (avstängd som standard)
+app.config['PROFILING_ENABLED'] = os.getenv('PROFILING_ENABLED') == 'true'
+app.config['PROFILING_SAMPLE_RATE'] = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))  # Andel requests som profileras utan header
+app.config['PROFILING_DIR'] = os.getenv('PROFILING_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILING_MAX_REPORTS'] = int(os.getenv('PROFILING_MAX_REPORTS', '50'))  # Äldre rapporter tas bort
+app.config['PROFILING_TOP_N'] = int(os.getenv('PROFILING_TOP_N', '30'))
+app.config['PROFILING_INTERVAL_MS'] = float(os.getenv('PROFILING_INTERVAL_MS', '1'))  # Intervall för stack-sampling
 
 # Aktivera CSRF-skydd
 csrf = CSRFProtect(app)
@@ -50,7 +65,7 @@ def csrf_optional_for_api_key(view):
         @wraps(view)
         def wrapped_view(*args, **kwargs):
             api_key = request.headers.get("X-API-Key")
-            if api_key and api_key == API_KEY:
+            if api_key and get_calendar_by_api_key(api_key):
                 # Direktundanta funktionen (görs en gång)
                 view._csrf_exempt = True
             return view(*args, **kwargs)
@@ -70,12 +85,9 @@ def generate_nonce():
 
 @app.before_request
 def before_request():
-    if not session.get('csrf_token'):
-        session['csrf_token'] = csrf._get_csrf_token()
-    
-    # Lägg till CSP header med nonce
+    # Lägg till CSP header med nonce (per request, så den sparas inte i sessionen)
     nonce = generate_nonce()
-    session['script_nonce'] = nonce
+    g.script_nonce = nonce
     
     # Strikt CSP policy
     csp = (
@@ -110,10 +122,10 @@ app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JSON_AS_ASCII'] = False  # Tillåt icke-ASCII tecken i JSON
 
-# API-nyckel från miljövariabel
+# API-nyckel från miljövariabel (används för standardkalendern)
 API_KEY = os.getenv('API_KEY')
 
-# Lösenordshash från miljövariabel
+# Lösenordshash från miljövariabel (används för standardkalendern)
 PASSWORD_HASH = os.getenv('PASSWORD_HASH', '8d969eef6ecad3c29a3a629280e686cf0c3f5d5a86aff3ca12020c923adc6c92')  # Default: "123456"
 
 # Konfigurera loggning
@@ -155,22 +167,33 @@ def record_login_attempt(ip, success):
     
     login_attempts[ip]['last_attempt'] = datetime.now()
 
+def get_authenticated_calendar_id():
+    """Kalendern requesten är autentiserad för, via API-nyckel eller session (None om ingen)"""
+    # Tillåt API-nyckel som alternativ till session
+    api_key = request.headers.get('X-API-Key')
+    if api_key:
+        calendar = get_calendar_by_api_key(api_key)
+        if calendar:
+            print("Authenticated via API key")  # Debug-utskrift
+            return calendar.id
+
+    # Alternativt: kontrollera session
+    is_logged_in = session.get('is_logged_in', False)
+    calendar_id = session.get('calendar_id')
+    if is_logged_in and calendar_id:
+        print("Authenticated via session")  # Debug-utskrift
+        return calendar_id
+
+    print("Authentication failed - no valid API key or session")  # Debug-utskrift
+    return None
+
 def require_auth(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Tillåt API-nyckel som alternativ till session
-        api_key = request.headers.get('X-API-Key')
-        if API_KEY and api_key == API_KEY:
-            print("Authenticated via API key")  # Debug-utskrift
+        calendar_id = get_authenticated_calendar_id()
+        if calendar_id:
+            g.calendar_id = calendar_id
             return f(*args, **kwargs)
-
-        # Alternativt: kontrollera session
-        is_logged_in = session.get('is_logged_in', False)
-        if is_logged_in:
-            print("Authenticated via session")  # Debug-utskrift
-            return f(*args, **kwargs)
-
-        print("Authentication failed - no valid API key or session")  # Debug-utskrift
         return jsonify({"error": "Unauthorized"}), 401
     return decorated_function
 
@@ -190,17 +213,39 @@ def run_migrations():
         traceback.print_exc()
         raise
 
-# Hämta titel från miljövariabel eller använd default
+# Hämta titel från miljövariabel eller använd default (används för standardkalendern)
 CALENDAR_TITLE = os.getenv('CALENDAR_TITLE', 'Calendar')
 
+# Kalendern som visas på / och som används när inloggningen inte anger någon kalender
+DEFAULT_CALENDAR_SLUG = 'default'
+
+def hash_secret(value):
+    return sha256(value.encode()).hexdigest()
+
+class Calendar(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    password_hash = db.Column(db.String(64), nullable=False)  # SHA-256 av lösenordet
+    api_key_hash = db.Column(db.String(64), unique=True, nullable=True)  # SHA-256 av API-nyckeln
+
 class Schedule(db.Model):
+    __table_args__ = (
+        # Alla frågor filtreras på kalender först, så indexen börjar med calendar_id
+        db.Index('ix_schedule_calendar_id_active', 'calendar_id', 'active'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), nullable=False)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
     weekdays = db.Column(db.String(100), nullable=False)  # Stored as JSON string
     active = db.Column(db.Boolean, default=True)
     end_date = db.Column(db.Date, nullable=True)
     start_date = db.Column(db.Date, nullable=True)
+    # Pauser läses in med en gemensam fråga för alla hämtade scheman
+    pauses = db.relationship('SchedulePause', lazy='selectin', order_by='SchedulePause.start_date',
+                             cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -210,21 +255,208 @@ class Schedule(db.Model):
             'weekdays': json.loads(self.weekdays),  # Konvertera från JSON-sträng till lista
             'active': self.active,
             'end_date': self.end_date.isoformat() if self.end_date else None,
-            'start_date': self.start_date.isoformat() if self.start_date else None
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'pauses': [pause.to_dict() for pause in self.pauses]
+        }
+
+    def is_paused(self, day):
+        return any(pause.start_date <= day <= pause.end_date for pause in self.pauses)
+
+class SchedulePause(db.Model):
+    """Period då ett schema inte ska skapa några uppgifter (t.ex. semester eller veterinärbesök)"""
+    __table_args__ = (
+        db.Index('ix_schedule_pause_calendar_id_schedule_id', 'calendar_id', 'schedule_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), nullable=False)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(200), nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'schedule_id': self.schedule_id,
+            'start_date': self.start_date.isoformat(),
+            'end_date': self.end_date.isoformat(),
+            'reason': self.reason
         }
 
 class Task(db.Model):
+    __table_args__ = (
+        db.Index('ix_task_calendar_id_date', 'calendar_id', 'date'),
+        db.Index('ix_task_calendar_id_schedule_id_date', 'calendar_id', 'schedule_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     task_type = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)  # Lägg till beskrivningsfält
     completed = db.Column(db.Boolean, default=False)
     missed = db.Column(db.Boolean, default=False)
     schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Ökas vid varje ändring
+
+# Kolumnerna som returneras när en uppgift ändras
+TASK_COLUMNS = (Task.id, Task.date, Task.task_type, Task.description, Task.completed,
+                Task.missed, Task.schedule_id, Task.version)
 
-def create_future_tasks():
-    # Hämta alla aktiva scheman
-    schedules = Schedule.query.filter_by(active=True).all()
+def task_to_dict(task):
+    return {
+        'id': task.id,
+        'date': task.date.strftime('%Y-%m-%d'),
+        'task_type': task.task_type,
+        'description': task.description,
+        'completed': task.completed,
+        'missed': task.missed,
+        'schedule_id': task.schedule_id,
+        'version': task.version
+    }
+
+def task_response(task):
+    response = jsonify(task_to_dict(task))
+    response.set_etag(str(task.version))
+    return response
+
+def get_expected_version():
+    """Läs versionen klienten förväntar sig från If-Match (None om headern saknas)"""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    tags = request.if_match.as_set(include_weak=True)
+    if len(tags) != 1:
+        raise ValueError('If-Match måste innehålla exakt en version')
+    return int(next(iter(tags)))
+
+def update_task(task_id, values, conditions=(), condition_error=None):
+    """Ändra en uppgift med en enda villkorad UPDATE ... RETURNING.
+
+    Returnerar (uppgift, None) om raden uppdaterades, annars (None, felsvar).
+    """
+    try:
+        expected_version = get_expected_version()
+    except ValueError:
+        return None, (jsonify({'error': 'Ogiltig If-Match header'}), 400)
+
+    criteria = [Task.id == task_id, Task.calendar_id == g.calendar_id, *conditions]
+    if expected_version is not None:
+        criteria.append(Task.version == expected_version)
+    stmt = db.update(Task.__table__).where(*criteria).values(version=Task.version + 1, **values)
+
+    if db.engine.dialect.full_returning:
+        task = db.session.execute(stmt.returning(*TASK_COLUMNS)).first()
+    else:
+        # SQLite saknar RETURNING i SQLAlchemy 1.4; läs raden i samma transaktion
+        task = None
+        if db.session.execute(stmt).rowcount:
+            task = db.session.execute(db.select(*TASK_COLUMNS).where(Task.id == task_id)).first()
+    db.session.commit()
+    if task is not None:
+        return task, None
+
+    # Ingen rad uppdaterades, ta reda på varför (bara på felvägen)
+    current = db.session.execute(
+        db.select(*TASK_COLUMNS).where(Task.id == task_id, Task.calendar_id == g.calendar_id)
+    ).first()
+    if current is None:
+        return None, (jsonify({'error': 'Aktiviteten finns inte'}), 404)
+    if expected_version is not None and current.version != expected_version:
+        return None, (jsonify({
+            'error': 'Aktiviteten har ändrats av någon annan',
+            'task': task_to_dict(current)
+        }), 409)
+    return None, condition_error
+
+class ServerSession(db.Model):
+    """Serverlagrad session; cookien innehåller bara id"""
+    __tablename__ = 'server_session'
+
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Sessioner lagras på servern enligt SESSION_TYPE
+init_session_store(app, db, ServerSession.__table__)
+
+# Sätts när standardkalendern har kontrollerats en gång i denna process
+default_calendar_checked = False
+
+def get_calendar_by_api_key(api_key):
+    """Slå upp kalendern som API-nyckeln hör till (None om nyckeln är okänd)"""
+    if not default_calendar_checked:
+        get_default_calendar()
+    return Calendar.query.filter_by(api_key_hash=hash_secret(api_key)).first()
+
+def get_default_calendar():
+    """Hämta standardkalendern och skapa den från miljövariablerna om den saknas.
+
+    Inloggningsuppgifterna synkas från PASSWORD_HASH och API_KEY, så att de
+    kan roteras genom att ändra miljövariablerna.
+    """
+    global default_calendar_checked
+    calendar = Calendar.query.filter_by(slug=DEFAULT_CALENDAR_SLUG).first()
+    default_calendar_checked = True
+    api_key_hash = hash_secret(API_KEY) if API_KEY else None
+    if calendar is None:
+        calendar = Calendar(
+            slug=DEFAULT_CALENDAR_SLUG,
+            title=CALENDAR_TITLE,
+            password_hash=PASSWORD_HASH,
+            api_key_hash=api_key_hash
+        )
+        db.session.add(calendar)
+        db.session.commit()
+    elif calendar.password_hash != PASSWORD_HASH or calendar.api_key_hash != api_key_hash:
+        calendar.password_hash = PASSWORD_HASH
+        calendar.api_key_hash = api_key_hash
+        db.session.commit()
+        logging.info("Updated credentials of the default calendar from environment variables")
+    return calendar
+
+def get_calendar_by_slug(slug):
+    if slug == DEFAULT_CALENDAR_SLUG:
+        return get_default_calendar()
+    return Calendar.query.filter_by(slug=slug).first()
+
+def build_schedule_tasks(schedule, first_date, last_date):
+    """Skapa (osparade) uppgifter för schemats veckodagar mellan två datum.
+
+    Datum som redan har en uppgift eller ligger i en paus hoppas över.
+    """
+    weekdays = json.loads(schedule.weekdays) if isinstance(schedule.weekdays, str) else schedule.weekdays
+    
+    # Hämta redan skapade datum för schemat i en fråga istället för en per dag
+    existing_dates = {
+        task_date for (task_date,) in db.session.query(Task.date).filter(
+            Task.calendar_id == schedule.calendar_id,
+            Task.schedule_id == schedule.id,
+            Task.date >= first_date,
+            Task.date <= last_date
+        )
+    }
+    
+    tasks = []
+    current_date = first_date
+    while current_date <= last_date:
+        if (current_date.weekday() in weekdays
+                and current_date not in existing_dates
+                and not schedule.is_paused(current_date)):
+            tasks.append(Task(
+                calendar_id=schedule.calendar_id,
+                date=current_date,
+                task_type=schedule.title,
+                description=schedule.description,
+                completed=False,
+                schedule_id=schedule.id
+            ))
+        current_date += timedelta(days=1)
+    return tasks
+
+def create_future_tasks(calendar_id):
+    # Hämta kalenderns aktiva scheman
+    schedules = Schedule.query.filter_by(calendar_id=calendar_id, active=True).all()
     today = datetime.now().date()
     max_end_date = today + timedelta(days=365*10)  # 10 år fram i tiden
     
@@ -247,34 +479,11 @@ def create_future_tasks():
                 start_date = today
             
             # Skapa uppgifter för varje dag från startdatum till slutdatumet
-            current_date = max(today, start_date)
-            weekdays = json.loads(schedule.weekdays) if isinstance(schedule.weekdays, str) else schedule.weekdays
-            tasks_for_schedule = 0
-            
-            while current_date <= end_date:
-                weekday = current_date.weekday()
-                
-                if weekday in weekdays:
-                    # Kontrollera om det redan finns en uppgift för detta datum och schema
-                    existing_task = Task.query.filter_by(
-                        date=current_date,
-                        schedule_id=schedule.id
-                    ).first()
-                    
-                    if not existing_task:
-                        all_tasks_to_create.append(Task(
-                            date=current_date,
-                            task_type=schedule.title,
-                            description=schedule.description,
-                            completed=False,
-                            schedule_id=schedule.id
-                        ))
-                        tasks_for_schedule += 1
-                
-                current_date += timedelta(days=1)
+            tasks_for_schedule = build_schedule_tasks(schedule, max(today, start_date), end_date)
+            all_tasks_to_create.extend(tasks_for_schedule)
             
-            if tasks_for_schedule > 0:
-                logging.debug(f"Prepared {tasks_for_schedule} tasks for schedule '{schedule.title}'")
+            if tasks_for_schedule:
+                logging.debug(f"Prepared {len(tasks_for_schedule)} tasks for schedule '{schedule.title}'")
                 
         except Exception as e:
             logging.error(f"Fel vid skapande av uppgifter för schema {schedule.id}: {str(e)}")
@@ -292,14 +501,22 @@ def create_future_tasks():
             db.session.rollback()
 
 @app.route('/')
-def index():
-    today = datetime.now().date()
-    today_tasks = Task.query.filter_by(date=today).all()
+@app.route('/c/<slug>')
+def index(slug=DEFAULT_CALENDAR_SLUG):
+    calendar = get_calendar_by_slug(slug)
+    if calendar is None:
+        abort(404)
+    # Dagens uppgifter visas bara för den som är inloggad på just denna kalender
+    today_tasks = []
+    if session.get('is_logged_in') and session.get('calendar_id') == calendar.id:
+        today = datetime.now().date()
+        today_tasks = Task.query.filter_by(calendar_id=calendar.id, date=today).all()
     return render_template('index.html', 
                          today_tasks=today_tasks, 
-                         calendar_title=CALENDAR_TITLE,
-                         csrf_token=session.get('csrf_token', csrf._get_csrf_token()),
-                         script_nonce=session.get('script_nonce', generate_nonce()))
+                         calendar_title=calendar.title,
+                         calendar_slug=calendar.slug,
+                         csrf_token=generate_csrf(),
+                         script_nonce=g.script_nonce)
 
 @app.route('/api/login', methods=['POST'])
 @csrf.exempt
@@ -307,6 +524,7 @@ def login():
     try:
         data = request.get_json()
         password = data.get('password', '')
+        calendar = get_calendar_by_slug(data.get('calendar') or DEFAULT_CALENDAR_SLUG)
         client_ip = get_client_ip()
         
         # Check if IP is blocked
@@ -321,9 +539,12 @@ def login():
         # Hash the password
         hashed_password = sha256(password.encode()).hexdigest()
 
-        if hashed_password == PASSWORD_HASH:
+        if calendar and hashed_password == calendar.password_hash:
             session.clear()
+            # Nytt session-ID vid inloggning så att ett ID från före inloggningen inte blir inloggat
+            app.session_interface.regenerate(session)
             session['is_logged_in'] = True
+            session['calendar_id'] = calendar.id
             session['login_time'] = datetime.now().isoformat()
             session.permanent = True
             record_login_attempt(client_ip, True)
@@ -346,6 +567,9 @@ def logout():
 @app.route('/api/check-session')
 def check_session():
     is_logged_in = session.get('is_logged_in', False)
+    # Sessionen gäller bara för kalendern man loggade in på
+    calendar = get_calendar_by_slug(request.args.get('calendar') or DEFAULT_CALENDAR_SLUG)
+    is_logged_in = bool(is_logged_in and calendar and session.get('calendar_id') == calendar.id)
     logging.debug("Session check - logged in: %s", is_logged_in)  # Säker loggning
     return jsonify({'logged_in': is_logged_in})
 
@@ -353,7 +577,7 @@ def check_session():
 @require_auth
 def get_schedules():
     try:
-        schedules = Schedule.query.all()
+        schedules = Schedule.query.filter_by(calendar_id=g.calendar_id).all()
         # Returnera tom array om inga scheman finns
         if not schedules:
             return jsonify([])
@@ -420,6 +644,7 @@ def create_schedule():
         
         # Skapa schemat
         schedule = Schedule(
+            calendar_id=g.calendar_id,
             title=data['title'],
             description=data.get('description'),
             weekdays=json.dumps(list(weekdays_set)),  # Konvertera till JSON-sträng
@@ -432,7 +657,7 @@ def create_schedule():
         db.session.commit()
         
         # Skapa framtida uppgifter
-        create_future_tasks()
+        create_future_tasks(g.calendar_id)
         
         return jsonify(schedule.to_dict()), 201
         
@@ -447,7 +672,7 @@ def create_schedule():
 @require_auth
 @csrf_optional_for_api_key
 def update_schedule(schedule_id):
-    schedule = Schedule.query.get_or_404(schedule_id)
+    schedule = Schedule.query.filter_by(id=schedule_id, calendar_id=g.calendar_id).first_or_404()
     data = request.get_json()
     
     # Validera weekdays
@@ -488,11 +713,12 @@ def update_schedule(schedule_id):
 @api_bp.route('/schedules/<int:schedule_id>', methods=['DELETE'])
 @require_auth
 def delete_schedule(schedule_id):
-    schedule = Schedule.query.get_or_404(schedule_id)
+    schedule = Schedule.query.filter_by(id=schedule_id, calendar_id=g.calendar_id).first_or_404()
     
     # Ta bort framtida uppgifter för detta schema
     today = datetime.now().date()
     Task.query.filter(
+        Task.calendar_id == g.calendar_id,
         Task.schedule_id == schedule_id,
         Task.date >= today
     ).delete()
@@ -501,6 +727,81 @@ def delete_schedule(schedule_id):
     db.session.commit()
     return '', 204
 
+def parse_pause_dates(data):
+    """Validera start_date och end_date för en paus; returnerar (start, slut, felmeddelande)"""
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+    except KeyError as e:
+        return None, None, f'Saknar obligatoriskt fält: {str(e)}'
+    except (ValueError, TypeError):
+        return None, None, 'ogiltigt datumformat'
+    if end_date < start_date:
+        return None, None, 'end_date kan inte vara före start_date'
+    return start_date, end_date, None
+
+@api_bp.route('/schedules/<int:schedule_id>/pauses', methods=['POST'])
+@require_auth
+@csrf_optional_for_api_key
+def pause_schedule(schedule_id):
+    schedule = Schedule.query.filter_by(id=schedule_id, calendar_id=g.calendar_id).first_or_404()
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'Ingen data skickades'}), 400
+    
+    start_date, end_date, error = parse_pause_dates(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    pause = SchedulePause(
+        calendar_id=g.calendar_id,
+        start_date=start_date,
+        end_date=end_date,
+        reason=data.get('reason')
+    )
+    schedule.pauses.append(pause)
+    
+    # Ta bort periodens uppgifter som inte är avbockade med en enda DELETE;
+    # utförda och missade uppgifter behålls som historik. Bara från och med idag,
+    # eftersom det är den delen av perioden som återskapas när pausen tas bort
+    removed = Task.query.filter(
+        Task.calendar_id == g.calendar_id,
+        Task.schedule_id == schedule.id,
+        Task.date.between(start_date, end_date),
+        Task.date >= datetime.now().date(),
+        Task.completed.isnot(True),
+        Task.missed.isnot(True)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    
+    logging.debug("Paused schedule %s from %s to %s, removed %d tasks", schedule.id, start_date, end_date, removed)
+    return jsonify({**pause.to_dict(), 'removed_tasks': removed}), 201
+
+@api_bp.route('/schedules/<int:schedule_id>/pauses/<int:pause_id>', methods=['DELETE'])
+@require_auth
+def resume_schedule(schedule_id, pause_id):
+    schedule = Schedule.query.filter_by(id=schedule_id, calendar_id=g.calendar_id).first_or_404()
+    pause = next((pause for pause in schedule.pauses if pause.id == pause_id), None)
+    if pause is None:
+        return jsonify({'error': 'Pausen finns inte'}), 404
+    
+    # Tar bort pausen (delete-orphan) innan uppgifterna skapas, så att bara
+    # eventuella andra pauser över samma dagar fortfarande gäller
+    schedule.pauses.remove(pause)
+    
+    # Återskapa bara den pausade perioden, begränsad till schemats egen period
+    today = datetime.now().date()
+    first_date = max(pause.start_date, today, schedule.start_date or today)
+    last_date = min(pause.end_date, schedule.end_date or today + timedelta(days=60))
+    created = []
+    if schedule.active and first_date <= last_date:
+        created = build_schedule_tasks(schedule, first_date, last_date)
+        db.session.bulk_save_objects(created)
+    db.session.commit()
+    
+    logging.debug("Resumed schedule %s, recreated %d tasks", schedule.id, len(created))
+    return jsonify({'created_tasks': len(created)})
+
 @app.route('/api/tasks', methods=['GET'])
 @require_auth
 def get_tasks():
@@ -508,7 +809,7 @@ def get_tasks():
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        query = Task.query
+        query = Task.query.filter_by(calendar_id=g.calendar_id)
         
         if start_date:
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -520,79 +821,62 @@ def get_tasks():
         tasks = query.all()
         logging.debug("Retrieved %d tasks from %s to %s", len(tasks), start_date, end_date)  # Säker loggning
         
-        return jsonify([{
-            'id': task.id,
-            'date': task.date.strftime('%Y-%m-%d'),
-            'task_type': task.task_type,
-            'description': task.description,
-            'completed': task.completed,
-            'missed': task.missed,
-            'schedule_id': task.schedule_id
-        } for task in tasks])
+        return jsonify([task_to_dict(task) for task in tasks])
     except Exception as e:
         return log_error(e, "Fel vid hämtning av uppgifter")
 
 @api_bp.route('/tasks/<int:task_id>/toggle', methods=['POST'])
 @require_auth
 def toggle_task(task_id):
-    task = Task.query.get_or_404(task_id)
     data = request.get_json()
     status = data.get('status')
     
+    # Växla i databasen så att samtidiga anrop inte skriver över varandra
+    was_completed = db.func.coalesce(Task.completed, db.false())
+    was_missed = db.func.coalesce(Task.missed, db.false())
     if status == 'completed':
-        task.completed = not task.completed
-        if task.completed:
-            task.missed = False
+        values = {
+            'completed': db.not_(was_completed),
+            'missed': db.case((was_completed, Task.missed), else_=db.false())
+        }
     elif status == 'missed':
-        task.missed = not task.missed
-        if task.missed:
-            task.completed = False
+        values = {
+            'missed': db.not_(was_missed),
+            'completed': db.case((was_missed, Task.completed), else_=db.false())
+        }
+    else:
+        return jsonify({'error': 'status måste vara completed eller missed'}), 400
     
-    db.session.commit()
-    return jsonify({
-        'id': task.id,
-        'date': task.date.isoformat(),
-        'task_type': task.task_type,
-        'completed': task.completed,
-        'missed': task.missed
-    })
+    task, error = update_task(task_id, values)
+    if error:
+        return error
+    return task_response(task)
 
 @api_bp.route('/tasks/<int:task_id>/reschedule', methods=['POST'])
 @require_auth
 def reschedule_task(task_id):
-    task = Task.query.get_or_404(task_id)
     data = request.json
     new_date = datetime.strptime(data['new_date'], '%Y-%m-%d').date()
     
     # Kontrollera att det nya datumet är inom 7 dagar från originaldatumet
-    if abs((new_date - task.date).days) > 7:
-        return jsonify({'error': 'Kan bara flytta aktiviteten inom 7 dagar från originaldatumet'}), 400
-    
-    task.date = new_date
-    db.session.commit()
-    return jsonify({
-        'id': task.id,
-        'date': task.date.strftime('%Y-%m-%d'),
-        'task_type': task.task_type,
-        'completed': task.completed,
-        'schedule_id': task.schedule_id
-    })
+    task, error = update_task(
+        task_id,
+        {'date': new_date},
+        conditions=[Task.date.between(new_date - timedelta(days=7), new_date + timedelta(days=7))],
+        condition_error=(jsonify({'error': 'Kan bara flytta aktiviteten inom 7 dagar från originaldatumet'}), 400)
+    )
+    if error:
+        return error
+    return task_response(task)
 
 @api_bp.route('/tasks/<int:task_id>/missed', methods=['POST'])
 @require_auth
 def mark_task_missed(task_id):
-    task = Task.query.get_or_404(task_id)
-    task.missed = True
-    task.completed = False  # Återställ completed om uppgiften markeras som missad
-    db.session.commit()
-    return jsonify({
-        'id': task.id,
-        'date': task.date.strftime('%Y-%m-%d'),
-        'task_type': task.task_type,
-        'completed': task.completed,
-        'missed': task.missed,
-        'schedule_id': task.schedule_id
-    })
+    # Återställ completed om uppgiften markeras som missad
+    task, error = update_task(task_id, {'missed': db.true(), 'completed': db.false()})
+    if error:
+        return error
+    return task_response(task)
 
 @app.route('/api/reminder-check')
 @require_auth
@@ -600,7 +884,7 @@ def check_reminders():
     today = datetime.now().date()
     
     # Hämta endast dagens uppgifter
-    tasks = Task.query.filter_by(date=today).all()
+    tasks = Task.query.filter_by(calendar_id=g.calendar_id, date=today).all()
     
     reminders = [{
         'title': task.task_type,
@@ -612,6 +896,49 @@ def check_reminders():
 # Registrera blueprinten
 app.register_blueprint(api_bp)
 
+# Profilera requests med X-Profile (kräver autentisering) eller enligt PROFILING_SAMPLE_RATE
+init_profiling(app, lambda: get_authenticated_calendar_id() is not None)
+
+@app.cli.command('create-calendar')
+@click.argument('slug')
+@click.argument('title')
+@click.option('--password', prompt=True, hide_input=True, help='Lösenord för inloggning')
+@click.option('--api-key', default=None, help='API-nyckel för externa anrop')
+def create_calendar_command(slug, title, password, api_key):
+    """Skapa en ny kalender med egna inloggningsuppgifter"""
+    if Calendar.query.filter_by(slug=slug).first():
+        raise click.ClickException(f"Kalendern '{slug}' finns redan")
+    calendar = Calendar(
+        slug=slug,
+        title=title,
+        password_hash=hash_secret(password),
+        api_key_hash=hash_secret(api_key) if api_key else None
+    )
+    db.session.add(calendar)
+    db.session.commit()
+    click.echo(f"✅ Skapade kalendern '{title}' på /c/{slug}")
+
+@app.cli.command('update-calendar')
+@click.argument('slug')
+@click.option('--title', default=None, help='Ny titel')
+@click.option('--password', default=None, help='Nytt lösenord för inloggning')
+@click.option('--api-key', default=None, help='Ny API-nyckel för externa anrop')
+def update_calendar_command(slug, title, password, api_key):
+    """Byt titel, lösenord eller API-nyckel för en befintlig kalender"""
+    if slug == DEFAULT_CALENDAR_SLUG and (password or api_key):
+        raise click.ClickException("Standardkalenderns inloggningsuppgifter styrs av PASSWORD_HASH och API_KEY")
+    calendar = Calendar.query.filter_by(slug=slug).first()
+    if calendar is None:
+        raise click.ClickException(f"Kalendern '{slug}' finns inte")
+    if title:
+        calendar.title = title
+    if password:
+        calendar.password_hash = hash_secret(password)
+    if api_key:
+        calendar.api_key_hash = hash_secret(api_key)
+    db.session.commit()
+    click.echo(f"✅ Uppdaterade kalendern '{calendar.title}'")
+
 # Kör migreringar även när Render kör 'gunicorn app:app'
 if os.getenv('RENDER') == 'true' or os.getenv('FLASK_ENV') == 'production':
     with app.app_context():
@@ -0,0 +1,348 @@
+"""Lasttest av kaninkalendern under gunicorn.
+
+Startar appen med gunicorn mot en lokal SQLite-fil (standard) eller en lokal
+PostgreSQL-databas, skapar några scheman och låter ett antal samtidiga
+användare navigera i kalendern, bocka av och flytta uppgifter, skapa scheman
+och polla påminnelser. Resultatet (genomströmning och p50/p95/p99 per
+endpoint) skrivs som JSON så att olika worker-/trådinställningar kan jämföras.
+
+Exempel:
+    python loadtest.py --workers 2 --threads 4 --concurrency 20 --duration 30
+    python loadtest.py --database-url postgresql://localhost/kanin_load --output pg.json
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from hashlib import sha256
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'lasttest'
+API_KEY = 'lasttest-api-key'
+
+# Relativ vikt för varje operation; ungefär hur en familj och några automationer använder appen
+DEFAULT_MIX = {
+    'month': 40,
+    'toggle': 25,
+    'reschedule': 10,
+    'reminders': 20,
+    'create_schedule': 5,
+}
+
+SCHEDULE_TITLES = ['Mata kaninerna', 'Byt vatten', 'Städa buren', 'Klipp klorna', 'Borsta pälsen']
+
+def parse_mix(value):
+    """Tolka '--mix month=40,toggle=25,...' till en dict med vikter"""
+    mix = dict(DEFAULT_MIX)
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Okänd operation: {name}")
+        mix[name] = int(weight)
+    return mix
+
+def percentile(sorted_values, pct):
+    """Percentil enligt nearest rank-metoden"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+class Client:
+    """En HTTP-anslutning med keep-alive och valfri session-cookie"""
+
+    def __init__(self, host, port, api_key=None):
+        self.host = host
+        self.port = port
+        self.api_key = api_key
+        self.cookie = None
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['X-API-Key'] = self.api_key
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        payload = json.dumps(body) if body is not None else None
+
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = None
+        return response.status, parsed
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+class Stats:
+    """Samlar latenser per endpoint från alla användartrådar"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.recording = False
+
+    def record(self, endpoint, seconds, ok):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        endpoints = {}
+        total = 0
+        for endpoint, values in sorted(self.latencies.items()):
+            values.sort()
+            total += len(values)
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p95_ms': round(percentile(values, 95) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2),
+            }
+        return {
+            'requests': total,
+            'errors': sum(self.errors.values()),
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0,
+            'endpoints': endpoints,
+        }
+
+class VirtualUser(threading.Thread):
+    """En familjemedlem (session) eller automation (API-nyckel) som kör operationsmixen"""
+
+    def __init__(self, number, args, stats, mix, stop_at):
+        super().__init__(daemon=True)
+        self.args = args
+        self.stats = stats
+        self.mix = mix
+        self.stop_at = stop_at
+        self.random = random.Random(args.seed + number)
+        self.uses_session = self.random.random() < args.session_share
+        self.client = Client('127.0.0.1', args.port, api_key=None if self.uses_session else API_KEY)
+        self.tasks = []
+
+    def timed(self, endpoint, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            self.stats.record(endpoint, time.perf_counter() - started, False)
+            return None, None
+        self.stats.record(endpoint, time.perf_counter() - started, status < 400)
+        return status, data
+
+    def run(self):
+        if self.uses_session:
+            status, _ = self.timed('POST /api/login', 'POST', '/api/login', {'password': PASSWORD})
+            if status != 200:
+                return
+        operations = list(self.mix)
+        weights = [self.mix[name] for name in operations]
+        while time.monotonic() < self.stop_at:
+            operation = self.random.choices(operations, weights)[0]
+            getattr(self, f'op_{operation}')()
+            if self.args.think_time:
+                time.sleep(self.random.uniform(0, self.args.think_time))
+        self.client.close()
+
+    def op_month(self):
+        # Som när man bläddrar en månad fram eller bak i kalendern
+        first = date.today().replace(day=1) + timedelta(days=31 * self.random.randint(-1, 2))
+        start = first.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        status, data = self.timed(
+            'GET /api/tasks', 'GET',
+            f'/api/tasks?start_date={start.isoformat()}&end_date={end.isoformat()}'
+        )
+        if status == 200 and data:
+            self.tasks = data
+
+    def op_toggle(self):
+        if not self.tasks:
+            return self.op_month()
+        task = self.random.choice(self.tasks)
+        status = self.random.choice(['completed', 'missed'])
+        self.timed('POST /api/tasks/<id>/toggle', 'POST', f"/api/tasks/{task['id']}/toggle", {'status': status})
+
+    def op_reschedule(self):
+        if not self.tasks:
+            return self.op_month()
+        task = self.random.choice(self.tasks)
+        new_date = date.fromisoformat(task['date']) + timedelta(days=self.random.randint(-3, 3))
+        status, data = self.timed(
+            'POST /api/tasks/<id>/reschedule', 'POST',
+            f"/api/tasks/{task['id']}/reschedule", {'new_date': new_date.isoformat()}
+        )
+        if status == 200:
+            task['date'] = data['date']
+
+    def op_reminders(self):
+        self.timed('GET /api/reminder-check', 'GET', '/api/reminder-check')
+
+    def op_create_schedule(self):
+        weekdays = sorted(self.random.sample(range(7), self.random.randint(1, 4)))
+        self.timed('POST /api/schedules', 'POST', '/api/schedules', {
+            'title': self.random.choice(SCHEDULE_TITLES),
+            'weekdays': weekdays,
+            'end_date': (date.today() + timedelta(days=self.random.randint(30, 120))).isoformat(),
+        })
+
+def build_env(args):
+    env = dict(os.environ)
+    env.update({
+        'SECRET_KEY': 'lasttest-secret',
+        'PASSWORD_HASH': sha256(PASSWORD.encode()).hexdigest(),
+        'API_KEY': API_KEY,
+        'DATABASE_URL': args.database_url,
+        'SESSION_TYPE': args.session_type,
+        'FLASK_APP': 'app.py',
+    })
+    # Undvik att migreringarna körs en gång till vid import i varje worker
+    env.pop('RENDER', None)
+    env.pop('FLASK_ENV', None)
+    return env
+
+def wait_until_ready(process, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn avslutades med kod {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/check-session')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn startade inte i tid')
+
+def seed(args):
+    """Skapa startscheman så att det finns uppgifter att navigera och bocka av"""
+    client = Client('127.0.0.1', args.port, api_key=API_KEY)
+    for index in range(args.schedules):
+        client.request('POST', '/api/schedules', {
+            'title': SCHEDULE_TITLES[index % len(SCHEDULE_TITLES)],
+            'weekdays': sorted(random.Random(index).sample(range(7), 3)),
+        })
+    client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='Databas att testa mot (standard: ny SQLite-fil i en temporär mapp)')
+    parser.add_argument('--session-type', default='sqlalchemy', choices=['sqlalchemy', 'sqlite'])
+    parser.add_argument('--workers', type=int, default=2, help='Antal gunicorn-workers')
+    parser.add_argument('--threads', type=int, default=1, help='Antal trådar per gunicorn-worker')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn --worker-class')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=10, help='Antal samtidiga användare')
+    parser.add_argument('--duration', type=float, default=30, help='Mättid i sekunder')
+    parser.add_argument('--warmup', type=float, default=3, help='Sekunder innan mätningen börjar')
+    parser.add_argument('--think-time', type=float, default=0, help='Max paus i sekunder mellan anrop per användare')
+    parser.add_argument('--session-share', type=float, default=0.5,
+                        help='Andel användare som loggar in med lösenord istället för API-nyckel')
+    parser.add_argument('--schedules', type=int, default=5, help='Antal scheman som skapas innan testet')
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help='Vikter per operation, t.ex. month=40,toggle=25,reschedule=10,reminders=20,create_schedule=5')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='loadtest-result.json', help='Fil som resultatet skrivs till')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='kaninkalender-load-') as tmpdir:
+        if not args.database_url:
+            args.database_url = 'sqlite:///' + os.path.join(tmpdir, 'loadtest.db')
+        env = build_env(args)
+        env['SESSION_SQLITE_PATH'] = os.path.join(tmpdir, 'sessions.sqlite3')
+
+        print('🔄 Kör migreringar...')
+        subprocess.run([sys.executable, '-m', 'flask', 'db', 'upgrade'], cwd=APP_DIR, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        gunicorn = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', 'app:app',
+            '--bind', f'127.0.0.1:{args.port}',
+            '--workers', str(args.workers),
+            '--threads', str(args.threads),
+            '--worker-class', args.worker_class,
+            '--log-level', 'warning',
+        ], cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL)
+        try:
+            wait_until_ready(gunicorn, args.port)
+            seed(args)
+
+            stats = Stats()
+            stop_at = time.monotonic() + args.warmup + args.duration
+            users = [VirtualUser(number, args, stats, args.mix, stop_at) for number in range(args.concurrency)]
+            print(f'🚀 {args.concurrency} användare mot {args.workers} workers x {args.threads} trådar...')
+            for user in users:
+                user.start()
+            time.sleep(args.warmup)
+            stats.recording = True
+            started = time.monotonic()
+            for user in users:
+                user.join()
+            stats.recording = False
+            elapsed = time.monotonic() - started
+        finally:
+            gunicorn.terminate()
+            gunicorn.wait()
+
+    result = {
+        'config': {
+            'database': args.database_url.split(':', 1)[0],
+            'session_type': args.session_type,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': args.worker_class,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'think_time_s': args.think_time,
+            'session_share': args.session_share,
+            'mix': args.mix,
+        },
+        'elapsed_s': round(elapsed, 2),
+        **stats.summary(elapsed),
+    }
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"✅ {result['requests']} anrop, {result['throughput_rps']} anrop/s, {result['errors']} fel")
+    print(f"{'endpoint':<34}{'antal':>8}{'fel':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, values in result['endpoints'].items():
+        print(f"{endpoint:<34}{values['requests']:>8}{values['errors']:>6}"
+              f"{values['p50_ms']:>9}{values['p95_ms']:>9}{values['p99_ms']:>9}")
+    print(f'📄 Resultat sparat i {args.output}')
+
+if __name__ == '__main__':
+    main()
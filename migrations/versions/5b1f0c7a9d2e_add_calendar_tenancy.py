@@ -0,0 +1,76 @@
+"""add calendar tenancy
+
+Revision ID: 5b1f0c7a9d2e
+Revises: 39999cf753a0
+Create Date: 2026-10-19 10:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from hashlib import sha256
+import os
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f0c7a9d2e'
+down_revision = '39999cf753a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    calendar_table = op.create_table('calendar',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slug', sa.String(length=50), nullable=False),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.Column('password_hash', sa.String(length=64), nullable=False),
+    sa.Column('api_key_hash', sa.String(length=64), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('api_key_hash'),
+    sa.UniqueConstraint('slug')
+    )
+
+    # Befintliga scheman och uppgifter flyttas till standardkalendern,
+    # som får inloggningsuppgifterna från miljövariablerna
+    api_key = os.getenv('API_KEY')
+    op.bulk_insert(calendar_table, [{
+        'id': 1,
+        'slug': 'default',
+        'title': os.getenv('CALENDAR_TITLE', 'Calendar'),
+        'password_hash': os.getenv('PASSWORD_HASH', '8d969eef6ecad3c29a3a629280e686cf0c3f5d5a86aff3ca12020c923adc6c92'),
+        'api_key_hash': sha256(api_key.encode()).hexdigest() if api_key else None,
+    }])
+
+    for table in ('schedule', 'task'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('calendar_id', sa.Integer(), nullable=True))
+        op.execute(f'UPDATE {table} SET calendar_id = 1')
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('calendar_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key(f'fk_{table}_calendar_id_calendar', 'calendar', ['calendar_id'], ['id'])
+
+    # Serien för calendar.id måste hoppa förbi den manuellt insatta raden i PostgreSQL
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("SELECT setval(pg_get_serial_sequence('calendar', 'id'), (SELECT MAX(id) FROM calendar))")
+
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.create_index('ix_schedule_calendar_id_active', ['calendar_id', 'active'], unique=False)
+
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.create_index('ix_task_calendar_id_date', ['calendar_id', 'date'], unique=False)
+        batch_op.create_index('ix_task_calendar_id_schedule_id_date', ['calendar_id', 'schedule_id', 'date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_calendar_id_schedule_id_date')
+        batch_op.drop_index('ix_task_calendar_id_date')
+        batch_op.drop_constraint('fk_task_calendar_id_calendar', type_='foreignkey')
+        batch_op.drop_column('calendar_id')
+
+    with op.batch_alter_table('schedule', schema=None) as batch_op:
+        batch_op.drop_index('ix_schedule_calendar_id_active')
+        batch_op.drop_constraint('fk_schedule_calendar_id_calendar', type_='foreignkey')
+        batch_op.drop_column('calendar_id')
+
+    op.drop_table('calendar')
@@ -0,0 +1,203 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile'
+
+# Nyckel i WSGI-environ som anger om requesten profileras på grund av X-Profile
+ENVIRON_REQUESTED = 'kaninkalender.profile_requested'
+
+def describe_code(filename, line, name):
+    # Mapp + filnamn räcker för att skilja t.ex. flask/app.py från appens egen app.py
+    short = os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+    return f'{name} ({short}:{line})'
+
+class RequestProfile:
+    """Profilering av en request: cProfile, stack-sampling och SQL-satser"""
+
+    def __init__(self, report_id, interval):
+        self.report_id = report_id
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.profiler = cProfile.Profile()
+        self.stacks = Counter()
+        self.statements = []
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # En annan profilerare är redan aktiv i processen; nöj oss med sampling
+            self.profiler = None
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        self.stopped.set()
+        self.sampler.join()
+
+    def _sample(self):
+        # Läs requesttrådens stack med jämna mellanrum och räkna identiska stackar
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # Funktionens första rad, så att varje funktion blir en nod i flamegraphen
+                stack.append(describe_code(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def record_statement(self, statement, seconds):
+        self.statements.append({'statement': statement, 'duration_ms': round(seconds * 1000, 3)})
+
+    def top_functions(self, top_n, sort_index):
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][sort_index], reverse=True)[:top_n]
+        return [{
+            'function': describe_code(filename, line, name),
+            'calls': calls,
+            'self_ms': round(self_time * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3)
+        } for (filename, line, name), (_, calls, self_time, cumulative, _) in rows]
+
+class ProfilingMiddleware:
+    """WSGI-middleware som profilerar utvalda requests, inklusive sessionshantering.
+
+    En request profileras om den skickar X-Profile och är autentiserad, eller
+    slumpmässigt enligt PROFILING_SAMPLE_RATE. Autentiseringen kontrolleras
+    innan profileringen startar, och högst en request per process profileras
+    åt gången, så att kostnaden för profileringen hålls begränsad.
+    """
+
+    def __init__(self, app, wsgi_app, is_authorized):
+        config = app.config
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.is_authorized = is_authorized
+        self.directory = config['PROFILING_DIR']
+        self.sample_rate = config['PROFILING_SAMPLE_RATE']
+        self.max_reports = config['PROFILING_MAX_REPORTS']
+        self.top_n = config['PROFILING_TOP_N']
+        self.interval = config['PROFILING_INTERVAL_MS'] / 1000
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __call__(self, environ, start_response):
+        requested = bool(environ.get('HTTP_' + PROFILE_HEADER.upper().replace('-', '_')))
+        # Ett X-Profile utan API-nyckel eller cookie kan aldrig bli godkänt
+        requested = requested and bool(environ.get('HTTP_X_API_KEY') or environ.get('HTTP_COOKIE'))
+        # X-Profile gäller bara för requests som är autentiserade på samma sätt som API:et
+        requested = requested and self.authorize(environ)
+        sampled = not requested and self.sample_rate and random.random() < self.sample_rate
+        if not (requested or sampled) or not self.lock.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            environ[ENVIRON_REQUESTED] = requested
+            # Tidsstämpeln först så att rapporterna sorteras i tidsordning vid rensning
+            report_id = datetime.now().strftime('%Y%m%dT%H%M%S%f-') + uuid.uuid4().hex[:8]
+            profile = RequestProfile(report_id, self.interval)
+            status = []
+
+            def profiled_start_response(response_status, headers, exc_info=None):
+                status.append(response_status)
+                headers = list(headers) + [('X-Profile-Id', profile.report_id)]
+                return start_response(response_status, headers, exc_info)
+
+            self.local.profile = profile
+            profile.start()
+            try:
+                return self.wsgi_app(environ, profiled_start_response)
+            finally:
+                profile.stop()
+                self.local.profile = None
+                self.write_report(profile, environ, status[0] if status else None)
+        finally:
+            self.lock.release()
+
+    def authorize(self, environ):
+        """Kontrollera API-nyckel eller session i en egen request-kontext, utan profilering"""
+        with self.app.request_context(dict(environ)):
+            return bool(self.is_authorized())
+
+    def active_profile(self):
+        return getattr(self.local, 'profile', None)
+
+    def write_report(self, profile, environ, status):
+        statements = profile.statements
+        report = {
+            'id': profile.report_id,
+            'method': environ.get('REQUEST_METHOD'),
+            'path': environ.get('PATH_INFO'),
+            'query': environ.get('QUERY_STRING'),
+            'status': status,
+            'trigger': 'header' if environ.get(ENVIRON_REQUESTED) else 'sample',
+            'duration_ms': round(profile.duration * 1000, 3),
+            'samples': sum(profile.stacks.values()),
+            'sql': {
+                'count': len(statements),
+                'total_ms': round(sum(item['duration_ms'] for item in statements), 3),
+                'statements': statements
+            },
+            'top_cumulative': profile.top_functions(self.top_n, 3),
+            'top_self': profile.top_functions(self.top_n, 2)
+        }
+        base = os.path.join(self.directory, profile.report_id)
+        with open(base + '.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        # Kollapsade stackar, direkt läsbara av flamegraph.pl och speedscope
+        with open(base + '.folded', 'w') as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        self.prune()
+
+    def prune(self):
+        """Behåll bara de PROFILING_MAX_REPORTS senaste rapporterna"""
+        report_ids = sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for report_id in report_ids[:-self.max_reports]:
+            for extension in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directory, report_id + extension))
+                except FileNotFoundError:
+                    pass
+
+def init_profiling(app, is_authorized):
+    """Koppla in profileringen om PROFILING_ENABLED är satt; annars görs ingenting"""
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    middleware = ProfilingMiddleware(app, app.wsgi_app, is_authorized)
+    app.wsgi_app = middleware
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if middleware.active_profile() is not None:
+            conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = middleware.active_profile()
+        started = conn.info.get('profiling_started')
+        if profile is not None and started:
+            profile.record_statement(statement, time.perf_counter() - started.pop())
@@ -0,0 +1,277 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from sqlalchemy import select
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Hur ofta (i sekunder) varje worker rensar bort utgångna sessioner
+SWEEP_INTERVAL = 3600
+
+# En sessions utgångstid förlängs bara när den lagrade tiden är äldre än så här (högst
+# halva livslängden), så att vanliga läsningar inte leder till en skrivning per request
+REFRESH_THRESHOLD = timedelta(days=1)
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session vars data ligger i databasen; cookien innehåller bara sessionens ID"""
+
+    def __init__(self, initial=None, sid=None, expires_at=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = new
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+class SQLAlchemySessionBackend:
+    """Lagrar sessioner i tabellen server_session i appens databas"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+
+    def load(self, sid):
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expires_at).where(self.table.c.id == sid)
+            ).first()
+        return tuple(row) if row else None
+
+    def save(self, sid, data, expires_at):
+        with self.db.engine.begin() as conn:
+            updated = conn.execute(
+                self.table.update().where(self.table.c.id == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                conn.execute(self.table.insert().values(id=sid, data=data, expires_at=expires_at))
+
+    def delete(self, sid):
+        with self.db.engine.begin() as conn:
+            conn.execute(self.table.delete().where(self.table.c.id == sid))
+
+    def sweep(self, now):
+        with self.db.engine.begin() as conn:
+            return conn.execute(self.table.delete().where(self.table.c.expires_at < now)).rowcount
+
+class SQLiteSessionBackend:
+    """Lagrar sessioner i en lokal SQLite-fil, oberoende av appens databas"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS server_session ('
+                'id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at TIMESTAMP NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_server_session_expires_at ON server_session (expires_at)')
+
+    def _connect(self):
+        # En anslutning per tråd, eftersom sqlite3-anslutningar inte får delas mellan trådar
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=10,
+                detect_types=sqlite3.PARSE_DECLTYPES
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+        return conn
+
+    def load(self, sid):
+        return self._connect().execute(
+            'SELECT data, expires_at FROM server_session WHERE id = ?', (sid,)
+        ).fetchone()
+
+    def save(self, sid, data, expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO server_session (id, data, expires_at) VALUES (?, ?, ?)',
+                (sid, data, expires_at)
+            )
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM server_session WHERE id = ?', (sid,))
+
+    def sweep(self, now):
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM server_session WHERE expires_at < ?', (now,)).rowcount
+
+class SessionCache:
+    """Liten LRU-cache per worker för lästa sessioner.
+
+    Posterna lever högst ttl sekunder, så att ändringar som gjorts av en annan
+    worker (t.ex. en utloggning) slår igenom även här.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sid):
+        if not self.size:
+            return None
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is None:
+                return None
+            data, expires_at, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl:
+                del self.entries[sid]
+                return None
+            self.entries.move_to_end(sid)
+            return data, expires_at
+
+    def put(self, sid, data, expires_at):
+        if not self.size:
+            return
+        with self.lock:
+            self.entries[sid] = (data, expires_at, time.monotonic())
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+class ServerSideSessionInterface(SessionInterface):
+    """Sessioner som lagras på servern och bara skrivs när de har ändrats"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, backend, cache_size=256, cache_ttl=5):
+        self.backend = backend
+        self.cache = SessionCache(cache_size, cache_ttl)
+        self.last_sweep = 0
+        self.sweep_lock = threading.Lock()
+
+    def generate_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def regenerate(self, session):
+        """Ge sessionen ett nytt ID och ta bort det gamla, t.ex. vid inloggning (skydd mot session fixation)"""
+        if not session.new:
+            self.backend.delete(session.sid)
+        self.cache.discard(session.sid)
+        session.sid = self.generate_sid()
+        session.new = True
+        session.modified = True
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and len(sid) <= 64:
+            now = datetime.utcnow()
+            cached = self.cache.get(sid)
+            if cached is not None:
+                data, expires_at = cached
+            else:
+                row = self.backend.load(sid)
+                data, expires_at = (self.serializer.loads(row[0]), row[1]) if row else (None, None)
+                if data is not None:
+                    self.cache.put(sid, data, expires_at)
+            if data is not None and expires_at > now:
+                # Kopiera så att ändringar under requesten inte smittar cachen
+                return ServerSideSession(dict(data), sid=sid, expires_at=expires_at)
+        return ServerSideSession(sid=self.generate_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # Tom session: ta bort den lagrade sessionen och cookien om den fanns
+        if not session:
+            if session.modified and not session.new:
+                self.backend.delete(session.sid)
+                self.cache.discard(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = datetime.utcnow()
+        # Icke-permanenta sessioner (t.ex. ej inloggade besökare) lever bara kort på servern
+        if session.permanent:
+            lifetime = app.permanent_session_lifetime
+        else:
+            lifetime = app.config['SESSION_TRANSIENT_LIFETIME']
+        expires_at = now + lifetime
+        needs_refresh = (
+            app.config['SESSION_REFRESH_EACH_REQUEST']
+            and session.expires_at is not None
+            and expires_at - session.expires_at > min(REFRESH_THRESHOLD, lifetime / 2)
+        )
+        if not (session.modified or needs_refresh):
+            return
+
+        data = dict(session)
+        self.backend.save(session.sid, self.serializer.dumps(data), expires_at)
+        self.cache.put(session.sid, data, expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+        self.sweep_expired(now)
+
+    def sweep_expired(self, now):
+        """Rensa utgångna sessioner, högst en gång per SWEEP_INTERVAL och worker"""
+        if time.monotonic() - self.last_sweep < SWEEP_INTERVAL:
+            return
+        if not self.sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_sweep = time.monotonic()
+            self.backend.sweep(now)
+        finally:
+            self.sweep_lock.release()
+
+def init_session_store(app, db, table):
+    """Koppla in serverlagrade sessioner enligt SESSION_TYPE ('sqlalchemy' eller 'sqlite')"""
+    session_type = app.config['SESSION_TYPE']
+    if session_type == 'sqlalchemy':
+        backend = SQLAlchemySessionBackend(db, table)
+    elif session_type == 'sqlite':
+        path = app.config.get('SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.sqlite3')
+        backend = SQLiteSessionBackend(path)
+    else:
+        raise ValueError(f"Unknown SESSION_TYPE: {session_type}")
+
+    app.session_interface = ServerSideSessionInterface(
+        backend,
+        cache_size=app.config['SESSION_CACHE_SIZE'],
+        cache_ttl=app.config['SESSION_CACHE_TTL']
+    )